@@ -1,15 +1,15 @@
 #!/usr/bin/env python
 
-# BE FOREWRANED:
-#
-# This is a simple implementation in recursive descent style, mirrored
-# off of the Racket/Guile scheme implementations.  However, a recursive
-# descent implementation is unlikely to be all to safe in Python-land
-# because there's no tail-call-elimination.
+# This is a simple implementation mirrored off of the Racket/Guile
+# scheme implementations.  Unlike those, the reader is driven by an
+# explicit stack of partially built containers rather than recursive
+# descent, since Python has no tail-call-elimination and deeply nested
+# messages would otherwise hit the recursion limit.
 
 import io
 import struct
 import string
+import weakref
 
 __all__ = [
     "SyrupDecodeError", "SyrupEncodeError", "SyrupSingleFloatsNotSupported",
@@ -31,9 +31,13 @@ class SyrupSingleFloatsNotSupported(Exception):
 
 
 class Record:
+    __slots__ = ('label', 'args')
+
     def __init__(self, label, args):
         self.label = label
-        self.args = list(args)
+        # The reader hands over freshly built lists it never reuses, so
+        # only copy when given some other iterable
+        self.args = args if type(args) is list else list(args)
 
     def __repr__(self):
         return "<Record %s: %r>" % (self.label, self.args)
@@ -45,8 +49,24 @@ class Record:
 
 
 class Symbol:
-    def __init__(self, name):
-        self.name = name
+    # Symbols are constructed for every record label in every message and
+    # the same handful of protocol symbols recur constantly, so they are
+    # interned: constructing a Symbol with a name already in use returns
+    # the existing instance, making the common equality and dict-lookup
+    # cases an identity comparison.
+    __slots__ = ('name', '_hash', '_encoded', '__weakref__')
+
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, name):
+        self = cls._interned.get(name)
+        if self is None:
+            self = super().__new__(cls)
+            self.name = name
+            self._hash = hash(name)
+            self._encoded = None
+            cls._interned[name] = self
+        return self
 
     def __repr__(self):
         return "Symbol(%s)" % self.name
@@ -55,209 +75,321 @@ class Symbol:
         return self.name
 
     def __hash__(self) -> int:
-        return hash(self.name)
+        return self._hash
 
     def __eq__(self, other):
-        return isinstance(other, Symbol) and other.name == self.name
+        return self is other or \
+            (isinstance(other, Symbol) and other.name == self.name)
+
+
+# Decimal encodings of small integers.  Length prefixes and most integer
+# values on a CapTP wire are small, so this skips the str+encode pair of
+# allocations for them.
+_small_int_enc = tuple(str(i).encode('latin-1') for i in range(4096))
 
 
 def netstring_encode(bstr, joiner=b':'):
-    octets = str(len(bstr)).encode("latin-1")
+    n = len(bstr)
+    octets = _small_int_enc[n] if n < 4096 else str(n).encode("latin-1")
     return octets + joiner + bstr
 
 
 def syrup_encode(obj):
-    # Bytes are like <bytes-len>:<bytes>
-    if isinstance(obj, bytes):
-        return netstring_encode(obj)
-    # True is t, False is f
-    elif obj is True:
-        return b't'
-    elif obj is False:
-        return b'f'
-    # Integers are like <integer>+ or <integer>-
-    elif isinstance(obj, int):
-        if obj == 0:
-            return b"0+"
-        elif obj > 0:
-            return str(obj).encode('latin-1') + b'+'
-        else:
-            return str((obj * -1)).encode('latin-1') + b'-'
-    # Lists are like [<item1><item2><item3>]
-    elif isinstance(obj, list):
-        encoded_items = [syrup_encode(item) for item in obj]
-        return b'[' + b''.join(encoded_items) + b']'
-    # Dictionaries are like {<key1><val1><key2><val2>}
-    # We sort by the key being fully encoded.
-    elif isinstance(obj, dict):
-        keys_and_encoded = [
-            (syrup_encode(key), key)
-            for key in obj.keys()]
-        sorted_keys_and_encoded = sorted(
-            keys_and_encoded,
-            key=lambda x: x[0])
-        encoded_hash_pairs = [
-            # combine the encoded key and encode the val immediately
-            ek[0] + syrup_encode(obj[ek[1]])
-            for ek in sorted_keys_and_encoded]
-        return b'{' + b''.join(encoded_hash_pairs) + b'}'
-    # Strings are like <encoded-bytes-len>"<utf8-encoded>
-    elif isinstance(obj, str):
-        return netstring_encode(obj.encode('utf-8'),
-                                joiner=b'"')
-    # Symbols are like <encoded-bytes-len>'<utf8-encoded>
-    elif isinstance(obj, Symbol):
-        return netstring_encode(obj.name.encode('utf-8'),
-                                joiner=b"'")
-    # Only double is supported in Python.  Single-precision not supported.
-    # Double flonum floats are like D<big-endian-encoded-double-float>
-    elif isinstance(obj, float):
-        return b'D' + struct.pack('>d', obj)
-    # Records are like <<tag><arg1><arg2>> but with the outer <> for realsies
-    elif isinstance(obj, Record):
-        return b'<' + \
-            syrup_encode(obj.label) +\
-            b''.join([syrup_encode(x) for x in obj.args]) + \
-            b'>'
-    # Sets are like #<item1><item2><item3>$
-    elif isinstance(obj, set):
-        encoded_items = [syrup_encode(x) for x in obj]
-        return b'#' + b''.join(sorted(encoded_items)) + b'$'
+    # All of the encoding helpers append into one shared bytearray so a
+    # message costs a single buffer rather than an allocation per node.
+    out = bytearray()
+    _encode_into(obj, out)
+    return bytes(out)
+
+
+def _netstring_into(bstr, out, joiner=b':'):
+    n = len(bstr)
+    out += _small_int_enc[n] if n < 4096 else str(n).encode("latin-1")
+    out += joiner
+    out += bstr
+
+
+def _encode_into(obj, out):
+    # Dispatch on the exact type in one lookup; bool has its own table
+    # entry, which both short-circuits True/False and keeps them off the
+    # integer path even though bool subclasses int.  The isinstance
+    # fallback below catches subclasses of the supported types.
+    encoder = _encoders.get(type(obj))
+    if encoder is not None:
+        encoder(obj, out)
+        return
+    for encoder_type, encoder in _encoders.items():
+        if isinstance(obj, encoder_type):
+            encoder(obj, out)
+            return
+    raise SyrupEncodeError("Unsupported type: %r" % obj)
+
+
+# True is t, False is f
+def _encode_bool(obj, out):
+    out += b't' if obj else b'f'
+
+
+# Bytes are like <bytes-len>:<bytes>
+def _encode_bytes(obj, out):
+    _netstring_into(obj, out)
+
+
+# Integers are like <integer>+ or <integer>-
+def _encode_int(obj, out):
+    if obj < 0:
+        obj = -obj
+        sign = b'-'
     else:
-        raise SyrupEncodeError("Unsupported type: %r" % obj)
-
-
-def peek_byte(f):
-    orig_pos = f.tell()
-    byte = f.read(1)
-    f.seek(orig_pos)
-    return byte
-
-
-whitespace_chars = string.whitespace.encode("latin-1")
-digit_chars = string.digits.encode("latin-1")
+        sign = b'+'
+    out += _small_int_enc[obj] if obj < 4096 else str(obj).encode('ascii')
+    out += sign
+
+
+# Lists are like [<item1><item2><item3>]
+def _encode_list(obj, out):
+    out += b'['
+    for item in obj:
+        _encode_into(item, out)
+    out += b']'
+
+
+# Dictionaries are like {<key1><val1><key2><val2>}
+# We sort by the key being fully encoded.
+def _encode_dict(obj, out):
+    pairs = [
+        (syrup_encode(key), syrup_encode(value))
+        for key, value in obj.items()]
+    pairs.sort(key=lambda p: p[0])
+    out += b'{'
+    for encoded_key, encoded_value in pairs:
+        out += encoded_key
+        out += encoded_value
+    out += b'}'
+
+
+# Strings are like <encoded-bytes-len>"<utf8-encoded>
+def _encode_str(obj, out):
+    _netstring_into(obj.encode('utf-8'), out,
+                    joiner=b'"')
+
+
+# Symbols are like <encoded-bytes-len>'<utf8-encoded>
+def _encode_symbol(obj, out):
+    # Interned symbols recur constantly (every record label), so the
+    # netstring encoding is computed once and cached on the instance
+    encoded = obj._encoded
+    if encoded is None:
+        encoded = netstring_encode(obj.name.encode('utf-8'), joiner=b"'")
+        obj._encoded = encoded
+    out += encoded
+
+
+# Only double is supported in Python.  Single-precision not supported.
+# Double flonum floats are like D<big-endian-encoded-double-float>
+def _encode_float(obj, out):
+    out += b'D' + double_struct.pack(obj)
+
+
+# Records are like <<tag><arg1><arg2>> but with the outer <> for realsies
+def _encode_record(obj, out):
+    out += b'<'
+    _encode_into(obj.label, out)
+    for x in obj.args:
+        _encode_into(x, out)
+    out += b'>'
+
+
+# Sets are like #<item1><item2><item3>$
+def _encode_set(obj, out):
+    encoded_items = [syrup_encode(x) for x in obj]
+    encoded_items.sort()
+    out += b'#'
+    for item in encoded_items:
+        out += item
+    out += b'$'
+
+
+_encoders = {
+    bool: _encode_bool,
+    bytes: _encode_bytes,
+    int: _encode_int,
+    list: _encode_list,
+    dict: _encode_dict,
+    str: _encode_str,
+    Symbol: _encode_symbol,
+    float: _encode_float,
+    Record: _encode_record,
+    set: _encode_set,
+}
+
+
+def _byte_set(chars):
+    """ frozenset of the individual bytes in `chars` for O(1) membership """
+    return frozenset(chars[i:i + 1] for i in range(len(chars)))
+
+
+whitespace_chars = _byte_set(string.whitespace.encode("latin-1"))
+# Indexed by byte ordinal, truthy where the byte is whitespace: skipping
+# whitespace is one table load per byte instead of a hashed membership test
+whitespace_table = bytes(
+    1 if chr(i) in string.whitespace else 0 for i in range(256))
+digit_chars = _byte_set(string.digits.encode("latin-1"))
+list_open_chars = _byte_set(b'[(l')
+list_close_chars = _byte_set(b'])e')
+dict_open_chars = _byte_set(b'{d')
+dict_close_chars = _byte_set(b'}e')
+
+# Precompiled so the format string isn't reparsed on every float
+double_struct = struct.Struct('>d')
+single_struct = struct.Struct('>f')
+
+
+# Marks a record or dictionary frame which is still waiting on a value
+_nothing = object()
+
+# Maps the byte which terminates a run of digits to the type it denotes
+netstring_joiner_types = {
+    b':': "bstr",
+    b'"': "str",
+    b"'": "sym",
+    b'+': "int+",
+    b'-': "int-",
+}
 
 
 def syrup_read(f, convert_singles=False):
-    def _syrup_read(f):
-        return syrup_read(f, convert_singles=convert_singles)
-
-    # consume whitespace
-    while peek_byte(f) in whitespace_chars:
-        f.read(1)
-
-    next_char = peek_byte(f)
-
-    # it's either a bytestring, string, or symbol depending on the joiner
-    if next_char in digit_chars:
-        _type = False
-        bytes_len_str = b''
-        while True:
-            this_char = f.read(1)
-            if this_char == b':':
-                _type = "bstr"
-                break
-            elif this_char == b'"':
-                _type = "str"
-                break
-            elif this_char == b"'":
-                _type = "sym"
-                break
-            elif this_char == b"+":
-                _type = "int+"
-                break
-            elif this_char == b"-":
-                _type = "int-"
-                break
-            elif this_char in digit_chars:
+    # Instead of recursing for every nested container, we keep an explicit
+    # stack of partially built containers.  Each frame is a mutable list:
+    #   ["list", items]
+    #   ["set", items]
+    #   ["record", label, args]
+    #   ["dict", dict, pending_key]
+    # Completed values are fed into the frame on top of the stack; when a
+    # container's terminator is read its frame is popped and the finished
+    # container is fed into the frame below (or returned at the top level).
+    stack = []
+
+    while True:
+        # The dispatch byte is consumed as it is read; every branch below
+        # acts on `next_char` directly rather than peeking and re-reading.
+        next_char = f.read(1)
+
+        # consume whitespace
+        while next_char and whitespace_table[next_char[0]]:
+            next_char = f.read(1)
+
+        # Check whether this byte terminates the container we're building
+        if stack:
+            frame = stack[-1]
+            frame_type = frame[0]
+            terminated = False
+            if frame_type == "list" and next_char in list_close_chars:
+                value = frame[1]
+                terminated = True
+            elif frame_type == "set" and next_char == b'$':
+                value = frame[1]
+                terminated = True
+            elif frame_type == "dict" and next_char in dict_close_chars \
+                    and frame[2] is _nothing:
+                value = frame[1]
+                terminated = True
+            elif frame_type == "record" and next_char == b'>' \
+                    and frame[1] is not _nothing:
+                value = Record(frame[1], frame[2])
+                terminated = True
+
+            if terminated:
+                stack.pop()
+                if not stack:
+                    return value
+                _feed_value(stack[-1], value)
+                continue
+
+        # it's either a bytestring, string, symbol or integer
+        if next_char in digit_chars:
+            bytes_len_str = bytearray()
+            this_char = next_char
+            while this_char in digit_chars:
                 bytes_len_str += this_char
-            else:
+                this_char = f.read(1)
+            _type = netstring_joiner_types.get(this_char)
+            if _type is None:
                 raise SyrupDecodeError(
                     "Invalid digit at pos %s: %r" % (
                         f.tell() - 1, this_char))
-        int_or_bytes_len = int(bytes_len_str.decode('latin-1'))
-        if _type == "int+":
-            return int_or_bytes_len
-        elif _type == "int-":
-            return int_or_bytes_len * -1
-        else:
-            bstr = f.read(int_or_bytes_len)
-            if _type == "bstr":
-                return bstr
-            elif _type == "sym":
-                return Symbol(bstr.decode('utf-8'))
-            elif _type == "str":
-                return bstr.decode('utf-8')
-    # it's a list
-    elif next_char in b'[(l':
-        f.read(1)
-        lst = []
-        while True:
-            if peek_byte(f) in b'])e':
-                f.read(1)
-                break
+            int_or_bytes_len = int(bytes(bytes_len_str))
+            if _type == "int+":
+                value = int_or_bytes_len
+            elif _type == "int-":
+                value = int_or_bytes_len * -1
             else:
-                lst.append(_syrup_read(f))
-        return lst
-    # it's a hashmap/dictionary
-    elif next_char in b'{d':
-        f.read(1)
-        d = dict()
-        while True:
-            if peek_byte(f) in b'}e':
-                f.read(1)
-                break
+                bstr = f.read(int_or_bytes_len)
+                if _type == "bstr":
+                    value = bstr
+                elif _type == "sym":
+                    value = Symbol(bstr.decode('utf-8'))
+                elif _type == "str":
+                    value = bstr.decode('utf-8')
+        # it's a list
+        elif next_char in list_open_chars:
+            stack.append(["list", []])
+            continue
+        # it's a hashmap/dictionary
+        elif next_char in dict_open_chars:
+            stack.append(["dict", dict(), _nothing])
+            continue
+        # it's a record
+        elif next_char == b'<':
+            stack.append(["record", _nothing, []])
+            continue
+        # single floats not supported in Python
+        elif next_char == b'F':
+            if convert_singles:
+                value = single_struct.unpack(f.read(4))[0]
             else:
-                key = _syrup_read(f)
-                val = _syrup_read(f)
-                d[key] = val
-        return d
-    # it's a record
-    elif next_char == b'<':
-        f.read(1)
-        label = _syrup_read(f)
-        args = []
-        while True:
-            if peek_byte(f) == b'>':
-                f.read(1)
-                break
-            else:
-                args.append(_syrup_read(f))
-        return Record(label, args)
-    # single floats not supported in Python
-    elif next_char == b'F':
-        if convert_singles:
-            f.read(1)
-            return struct.unpack('>f', f.read(4))[0]
+                raise SyrupSingleFloatsNotSupported(
+                    "Single floats not supported in Python and coersion disabled")
+        # it's a double float
+        elif next_char == b'D':
+            value = double_struct.unpack(f.read(8))[0]
+        # it's a boolean
+        elif next_char == b'f':
+            value = False
+        elif next_char == b't':
+            value = True
+        # it's a set
+        elif next_char == b'#':
+            stack.append(["set", set()])
+            continue
         else:
-            raise SyrupSingleFloatsNotSupported(
-                "Single floats not supported in Python and coersion disabled")
-    # it's a double float
-    elif next_char == b'D':
-        f.read(1)
-        return struct.unpack('>d', f.read(8))[0]
-    # it's a boolean
-    elif next_char == b'f':
-        f.read(1)
-        return False
-    elif next_char == b't':
-        f.read(1)
-        return True
-    # it's a set
-    elif next_char == b'#':
-        f.read(1)
-        s = set()
-        while True:
-            if peek_byte(f) == b'$':
-                f.read(1)
-                break
-            else:
-                s.add(_syrup_read(f))
-        return s
-    else:
-        raise SyrupEncodeError(
-            "Unexpected character and position %s: %s" %
-            (f.tell(), next_char))
+            raise SyrupEncodeError(
+                "Unexpected character and position %s: %s" %
+                (f.tell(), next_char))
+
+        if not stack:
+            return value
+        _feed_value(stack[-1], value)
+
+
+def _feed_value(frame, value):
+    """ Feed a completed value into a partially built container frame """
+    frame_type = frame[0]
+    if frame_type == "list":
+        frame[1].append(value)
+    elif frame_type == "set":
+        frame[1].add(value)
+    elif frame_type == "record":
+        if frame[1] is _nothing:
+            frame[1] = value
+        else:
+            frame[2].append(value)
+    elif frame_type == "dict":
+        if frame[2] is _nothing:
+            frame[2] = value
+        else:
+            frame[1][frame[2]] = value
+            frame[2] = _nothing
 
 
 def syrup_decode(bstr, convert_singles=False):
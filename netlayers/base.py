@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 from abc import ABC, abstractmethod
+import os
 import socket
 
 from contrib import syrup
@@ -20,9 +21,36 @@ from utils.ocapn_uris import OCapNNode
 from utils.captp import CapTPSession
 
 
+# Buffer sizes are overridable so runs against slow or unusual paths can
+# be tuned without editing code (the kernel may clamp what it grants)
+_SO_RCVBUF = int(os.environ.get("OCAPN_TEST_SO_RCVBUF", 2 << 20))
+_SO_SNDBUF = int(os.environ.get("OCAPN_TEST_SO_SNDBUF", 2 << 20))
+
+
+def tune_socket(sock):
+    """ Apply throughput-oriented socket options, ignoring unsupported ones
+
+    The kernel's default buffers throttle bulk transfers on high
+    bandwidth-delay paths such as onion circuits; 2 MiB lifts that
+    ceiling.  Keepalive stops long-idle test connections dying silently.
+    """
+    for level, option, value in (
+            (socket.SOL_SOCKET, socket.SO_RCVBUF, _SO_RCVBUF),
+            (socket.SOL_SOCKET, socket.SO_SNDBUF, _SO_SNDBUF),
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)):
+        try:
+            sock.setsockopt(level, option, value)
+        except OSError:
+            pass
+
+
 class ReadSocketIO:
     """ Wrapper around a socket which allows us to read from it like a file """
 
+    # How much to ask the kernel for per recv.  Reading ahead in batches
+    # means the parser's many single-byte reads are served from memory.
+    RECV_SIZE = 65536
+
     def __init__(self, socket, timeout=None):
         self._socket = socket
         self._buffer = bytearray()
@@ -31,20 +59,26 @@ class ReadSocketIO:
             self._socket.settimeout(timeout)
 
     def read(self, size):
-        """ Read up to `size` bytes from the socket """
-        amount_read_ahead = len(self._buffer) - self._seek_position
-        if amount_read_ahead >= size:
-            # We have enough data in the buffer, just return it
-            data = self._buffer[self._seek_position:self._seek_position+size]
-            self._seek_position += size
-            return data
-
-        # We need to read more data from the socket
-        data = self._socket.recv(size - amount_read_ahead)
-        if len(data) == 0:
-            raise ConnectionAbortedError("Socket closed")
-        self._buffer += data
-        self._seek_position += len(data)
+        """ Read exactly `size` bytes, buffering ahead from the socket """
+        # Once everything buffered has been consumed there is nothing left
+        # to seek back to, so drop the old data rather than accumulating
+        # every byte ever received.
+        if self._seek_position and self._seek_position == len(self._buffer):
+            self._buffer = bytearray()
+            self._seek_position = 0
+
+        # recv may return less than asked for, so keep reading until the
+        # request can be satisfied from the buffer.  Asking for a batch
+        # rather than the exact remainder amortises the syscall cost over
+        # a whole message.
+        while len(self._buffer) - self._seek_position < size:
+            data = self._socket.recv(self.RECV_SIZE)
+            if len(data) == 0:
+                raise ConnectionAbortedError("Socket closed")
+            self._buffer += data
+
+        data = bytes(self._buffer[self._seek_position:self._seek_position+size])
+        self._seek_position += size
         return data
 
     def seek(self, position):
@@ -75,9 +109,14 @@ class CapTPSocket(socket.socket):
         Important: This will detach the socket from the original socket object,
         do not continue to use the original socket object after calling this.
         """
+        # Already one of ours (e.g. a Socks5Proxy); rewrapping would just
+        # dup the fd and re-tune it for nothing
+        if isinstance(socket, CapTPSocket):
+            return socket
         captp_socket = cls(fileno=socket.fileno())
         captp_socket.settimeout(socket.gettimeout())
         socket.detach()
+        tune_socket(captp_socket)
         return captp_socket
 
     def send_message(self, message):
@@ -88,7 +127,13 @@ class CapTPSocket(socket.socket):
 
     def receive_message(self, timeout=120) -> CapTPType:
         """ Receive data from the remote node """
-        socketio = ReadSocketIO(self, timeout=timeout)
+        # The reader is kept for the lifetime of the socket: it may have
+        # buffered the start of the next message beyond the one being
+        # returned, so it cannot be thrown away between messages.
+        socketio = getattr(self, "_socketio", None)
+        if socketio is None:
+            socketio = self._socketio = ReadSocketIO(self)
+        self.settimeout(timeout)
         encoded_message = syrup.syrup_read(socketio)
         assert isinstance(encoded_message, syrup.Record)
         return decode_captp_message(encoded_message)
@@ -99,6 +144,20 @@ class Netlayer(ABC):
 
     location: OCapNNode
 
+    # Netlayers are context managers so their resources (sockets, any
+    # spawned processes) are released at a predictable point rather than
+    # whenever the GC gets around to them.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    @abstractmethod
+    def shutdown(self):
+        """ Shuts down the netlayer, releasing its resources """
+        pass
+
     @abstractmethod
     def connect(self, ocapn_node: OCapNNode) -> CapTPSession:
         """ Connect to a remote node returning a connection """
@@ -12,187 +12,221 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
 import tempfile
+import threading
 import socket
 import os
+import weakref
 
 from typing import Tuple
 
 from contrib import syrup
-from netlayers.base import CapTPSocket, Netlayer
+from netlayers.base import CapTPSocket, Netlayer, tune_socket
 
-import stem.process
 from utils.ocapn_uris import OCapNNode
 
 from utils.captp import CapTPSession
 
 
+_SYM_ONION = syrup.Symbol("onion")
+
+# SOCKS5 reply codes (RFC 1928, section 6).  0 means success.
+_SOCKS5_ERRORS = {
+    0: None,
+    1: "General SOCKS server failure",
+    2: "Connection not allowed by ruleset",
+    3: "Network unreachable",
+    4: "Host unreachable",
+    5: "Connection refused",
+    6: "TTL expired",
+    7: "Command not supported",
+    8: "Address type not supported",
+}
+
+
 class Socks5Proxy(CapTPSocket):
     """ Basic implementation of a SOCKS5 proxy (RFC 1928) using unix sockets """
 
     def __init__(self, unix_socket_path):
         self._unix_socket_path = unix_socket_path
         super().__init__(socket.AF_UNIX, socket.SOCK_STREAM)
+        tune_socket(self)
 
-    def __del__(self):
-        self.close()
-        super().__del__()
-
-    def _read_and_expect_protocol5(self):
-        """ Read the initial protocol version and expect it to be 5 """
-        protocol_version = self.recv(1)
-        if protocol_version != b"\x05":
-            raise Exception(f"Wrong protocol version: {protocol_version}")
+    def _recv_exact(self, size) -> bytes:
+        """ Read exactly `size` bytes, looping on short reads """
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.recv(size - len(data))
+            if len(chunk) == 0:
+                raise ConnectionAbortedError("Socket closed")
+            data += chunk
+        return bytes(data)
 
-    def _read_and_expect_no_auth(self):
-        """ Read the authentication method and expect it to be no auth """
-        auth_method = self.recv(1)
-        if auth_method != b"\x00":
-            raise Exception(f"Unsupported authentication method: {auth_method}")
-
-    def _error_number_to_string(self, error_number) -> str | None:
-        if error_number == b"\x00":
-            return None
-        elif error_number == b"\x01":
-            return "General SOCKS server failure"
-        elif error_number == b"\x02":
-            return "Connection not allowed by ruleset"
-        elif error_number == b"\x03":
-            return "Network unreachable"
-        elif error_number == b"\x04":
-            return "Host unreachable"
-        elif error_number == b"\x05":
-            return "Connection refused"
-        elif error_number == b"\x06":
-            return "TTL expired"
-        elif error_number == b"\x07":
-            return "Command not supported"
-        elif error_number == b"\x08":
-            return "Address type not supported"
-        return f"Unknown error {error_number}"
+    def _error_number_to_string(self, error_number: int) -> str | None:
+        return _SOCKS5_ERRORS.get(error_number, f"Unknown error {error_number}")
 
     def connect(self, address, port) -> None:
         """ Connect to a remote address """
+        # Validate the address before talking to the proxy so malformed
+        # input fails without wasting a round trip to the Tor daemon.
+        # Tor V3 onion addresses are always 62 characters long
+        if len(address) != 62:
+            raise Exception(f"Invalid tor onion V3 address: {address}")
+        encoded_address = address.encode("ascii")
+
         super().connect(self._unix_socket_path)
 
         # Protocol version 5, mmethod 1, no auth
         self.sendall(b"\x05\x01\x00")
-        self._read_and_expect_protocol5()
-        self._read_and_expect_no_auth()
+        # The method-selection reply is version + chosen method
+        greeting_reply = self._recv_exact(2)
+        if greeting_reply[0:1] != b"\x05":
+            raise Exception(f"Wrong protocol version: {greeting_reply[0:1]}")
+        if greeting_reply[1:2] != b"\x00":
+            raise Exception(
+                f"Unsupported authentication method: {greeting_reply[1:2]}")
+
+        # Connect to the remote address, sending the whole request as one
+        # packet: protocol version 5, command 1, reserved 0, RDNS 3,
+        # address length, address and port.
+        connect_request = (
+            b"\x05\x01\x00\x03\x3e"
+            + encoded_address
+            + port.to_bytes(2, "big")
+        )
+        self.sendall(connect_request)
 
-        # Connect to the remote address
-        # Protocol version 5, command 1, reserved 0, RDNS 3
-        self.sendall(b"\x05\x01\x00\x03")
-        # Tor V3 onion addresses are always 62 characters long
-        if len(address) != 62:
-            raise Exception("Invalid tor onion V3 address: {address}")
-        self.sendall(b"\x3e")
-        self.sendall(address.encode("ascii"))
-        self.sendall(port.to_bytes(2, "big"))
-        self._read_and_expect_protocol5()
-
-        # Read the result and check for errors
-        possible_error = self._error_number_to_string(self.recv(1))
+        # The reply's fixed-size header is version, result, a reserved
+        # byte and the address type; read it in one go rather than a
+        # syscall per field.
+        protocol_version, result, _, address_type = self._recv_exact(4)
+        if protocol_version != 5:
+            raise Exception(f"Wrong protocol version: {protocol_version}")
+        possible_error = self._error_number_to_string(result)
         if possible_error is not None:
             raise Exception(f"Error connecting to remote address: {possible_error}")
-        # Reserved byte
-        self.recv(1)
-        # Address type
-        address_type = self.recv(1)
-        if address_type == b"\x01":
+
+        # The bound address, whose length depends on the address type
+        if address_type == 1:
             # IPv4 address
-            self.recv(4)
-        elif address_type == b"\x03":
-            # Domain name
-            self.recv(self.recv(1)[0])
-        elif address_type == b"\x04":
+            self._recv_exact(4)
+        elif address_type == 3:
+            # Domain name, length-prefixed
+            self._recv_exact(self._recv_exact(1)[0])
+        elif address_type == 4:
             # IPv6 address
-            self.recv(16)
+            self._recv_exact(16)
         else:
             raise Exception(f"Unknown address type: {address_type}")
         # Finally, read the port
-        self.recv(2)
+        self._recv_exact(2)
 
 
-class OnionNetlayer(Netlayer):
-    PORT = 9045
+class _TorDaemon:
+    """ A single Tor process shared by every OnionNetlayer
+
+    Tor bootstrap takes many seconds, so instead of each OnionNetlayer
+    spawning its own daemon, one process is started lazily and each
+    netlayer allocates its own hidden service from it.  The daemon is
+    shut down at interpreter exit.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> "_TorDaemon":
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                atexit.register(cls._shutdown_instance)
+            return cls._instance
+
+    @classmethod
+    def _shutdown_instance(cls):
+        with cls._lock:
+            if cls._instance is not None:
+                cls._instance.shutdown()
+                cls._instance = None
 
     def __init__(self):
+        # stem is a heavy import and only needed for the onion netlayer,
+        # so it is deferred until one is actually constructed
         import stem.process
-        self._connections = []
 
-        # Create a temp directory for us to use for tor
-        self._temp_dir = tempfile.TemporaryDirectory()
-        self._unix_socket_path = os.path.join(self._temp_dir.name, "tor.sock")
+        # Create a temp directory for us to use for tor.  On Linux prefer
+        # tmpfs-backed /dev/shm so Tor's data directory (and its fsyncs)
+        # never touch disk; nothing in it needs to outlive the test run.
+        self._temp_dir = tempfile.TemporaryDirectory(
+            dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+        self.socks_socket_path = os.path.join(self._temp_dir.name, "tor.sock")
         control_socket_path = os.path.join(self._temp_dir.name, "control.sock")
         data_dir_path = os.path.join(self._temp_dir.name, "data")
 
         # Start a Tor process
         self._tor_process = stem.process.launch_tor_with_config(
             config={
-                "SocksPort": f"unix:{self._unix_socket_path}",
+                "SocksPort": f"unix:{self.socks_socket_path}",
                 "ControlPort": f"unix:{control_socket_path}",
                 "DataDirectory": data_dir_path,
             }
         )
 
-        # We have to setup a hidden service for them to connect to us
+        self._service_count = 0
+        self._ctrl_buf = bytearray()
         self._control_socket = socket.socket(
             socket.AF_UNIX, socket.SOCK_STREAM
         )
         self._control_socket.connect(control_socket_path)
-        self._incoming_control_socket, self.location = self.add_hidden_service()
-
-    def __del__(self):
-        self.shutdown()
 
-    def connect(self, ocapn_node: OCapNNode) -> CapTPSession:
-        """ Connect to the remote node """
-        # Finally setup a socket and connect to the CapTP server
-        hidden_service_uri = f"{ocapn_node.address}.onion"
-        onion_sock = Socks5Proxy(self._unix_socket_path)
-        onion_sock.connect(hidden_service_uri, self.PORT)
+        # Authenticate with the control socket.  Tor accepts pipelined
+        # commands, so rather than waiting for the reply here it is
+        # consumed just before the reply to the next command, saving a
+        # control-socket round trip at startup.
+        self._control_socket.sendall(b"AUTHENTICATE\r\n")
+        self._pending_auth_reply = True
 
-        connection = CapTPSocket.from_socket(onion_sock)
-        self._connections.append(connection)
-        return CapTPSession(connection, self.location, is_outbound=True)
-
-    def accept(self, timeout=120) -> CapTPSession:
-        """ Blocks until a CapTP connection is received, returning the socket """
-        self._incoming_control_socket.settimeout(timeout)
-        sock, addr = self._incoming_control_socket.accept()
-        connection = CapTPSocket.from_socket(sock)
-        self._connections.append(connection)
-        return CapTPSession(connection, self.location, is_outbound=False)
+    def _consume_pending_auth_reply(self):
+        """ Read the AUTHENTICATE reply if it hasn't been consumed yet """
+        if self._pending_auth_reply:
+            self._pending_auth_reply = False
+            self._read_and_expect(self._control_socket, b"250 OK\r\n")
 
     def _read_and_expect(self, socket, expected):
         """ Read from a socket and expect a specific value """
-        data = socket.recv(len(expected))
+        while len(self._ctrl_buf) < len(expected):
+            self._ctrl_buf += socket.recv(4096)
+        data = bytes(self._ctrl_buf[:len(expected)])
+        del self._ctrl_buf[:len(expected)]
         if data != expected:
             raise Exception(f"Unexpected response from socket. Read {data}, but expected: {expected}")
 
     def _read_until_newline(self, socket) -> bytes:
         """ Read from a socket until we get a newline """
-        data = bytearray()
-        while True:
-            data += socket.recv(1)
-            if data[-1] == ord("\n"):
-                return data
-
-    def add_hidden_service(self) -> Tuple[CapTPSocket, OCapNNode]:
-        """ Add a hidden service to the Tor process """
+        # Control replies arrive as several small lines; recv in bulk into
+        # a shared buffer and hand out one line at a time.
+        while b"\n" not in self._ctrl_buf:
+            self._ctrl_buf += socket.recv(4096)
+        line, _, rest = self._ctrl_buf.partition(b"\n")
+        self._ctrl_buf = rest
+        return bytes(line + b"\n")
+
+    def add_hidden_service(self, port) -> Tuple[CapTPSocket, str]:
+        """ Add a hidden service, returning its listening socket and service ID """
         if self._control_socket is None:
             raise Exception("Cannot add a hidden service after the control socket has been closed")
 
-        # Authenticate with the control socket
-        self._control_socket.sendall(b"AUTHENTICATE\r\n")
-        self._read_and_expect(self._control_socket, b"250 OK\r\n")
-
-        ocapn_sock_path = os.path.join(self._temp_dir.name, "ocapn.sock")
+        # Each hidden service gets its own unix socket in the shared
+        # temp directory
+        self._service_count += 1
+        ocapn_sock_path = os.path.join(
+            self._temp_dir.name, f"ocapn-{self._service_count}.sock")
         self._control_socket.sendall(
-            f"ADD_ONION NEW:ED25519-V3 PORT={self.PORT},unix:{ocapn_sock_path}\r\n"
+            f"ADD_ONION NEW:ED25519-V3 PORT={port},unix:{ocapn_sock_path}\r\n"
             .encode("ascii")
         )
+        self._consume_pending_auth_reply()
 
         # Read the ServiceID
         service_id = self._read_until_newline(self._control_socket)
@@ -208,23 +242,32 @@ class OnionNetlayer(Netlayer):
             raise Exception(f"Unexpected response from socket: {private_key}")
         private_key = private_key[15:].strip()
 
+        # The reply is terminated by a final status line; consume it so
+        # the buffer is aligned for the next command
+        self._read_and_expect(self._control_socket, b"250 OK\r\n")
+
         # Setup a socket to listen for incoming connections
         incoming_control_socket = CapTPSocket(
             socket.AF_UNIX, socket.SOCK_STREAM
         )
         incoming_control_socket.bind(ocapn_sock_path)
-        incoming_control_socket.listen()
+        # An explicit backlog so simultaneous connects through Tor queue
+        # rather than being refused
+        incoming_control_socket.listen(128)
 
-        # Create the OCapNNode that represents this hidden service
-        ocapn_node = OCapNNode(syrup.Symbol("onion"), service_id, False)
+        return incoming_control_socket, service_id
 
-        return incoming_control_socket, ocapn_node
+    def remove_hidden_service(self, service_id):
+        """ Remove a hidden service previously added with add_hidden_service """
+        if self._control_socket is None:
+            return
+        self._control_socket.sendall(
+            f"DEL_ONION {service_id}\r\n".encode("ascii"))
+        self._consume_pending_auth_reply()
+        self._read_and_expect(self._control_socket, b"250 OK\r\n")
 
     def shutdown(self):
-        """ Shuts down the netlayer """
-        for connection in self._connections:
-            connection.close()
-
+        """ Shuts down the Tor process and its control socket """
         # These attributes are setup in the __init__ method, so should always exist
         # however there are situations where an error occurs before they are set
         if getattr(self, "_tor_process", None) is not None:
@@ -235,5 +278,64 @@ class OnionNetlayer(Netlayer):
             self._control_socket.close()
             self._control_socket = None
 
-        if getattr(self, "_incoming_control_socket", None) is not None:
+        if getattr(self, "_temp_dir", None) is not None:
             self._temp_dir.cleanup()
+            self._temp_dir = None
+
+
+class OnionNetlayer(Netlayer):
+    PORT = 9045
+
+    def __init__(self):
+        # Weak references so connections a test has dropped can be
+        # collected instead of accumulating until shutdown
+        self._connections = weakref.WeakSet()
+
+        # One Tor daemon is shared between all netlayer instances; we
+        # only own our hidden service and its listening socket
+        self._daemon = _TorDaemon.get()
+        self._unix_socket_path = self._daemon.socks_socket_path
+        self._incoming_control_socket, service_id = \
+            self._daemon.add_hidden_service(self.PORT)
+        self.location = OCapNNode(_SYM_ONION, service_id, False)
+
+    def connect(self, ocapn_node: OCapNNode) -> CapTPSession:
+        """ Connect to the remote node """
+        # Finally setup a socket and connect to the CapTP server
+        hidden_service_uri = f"{ocapn_node.address}.onion"
+        onion_sock = Socks5Proxy(self._unix_socket_path)
+        onion_sock.connect(hidden_service_uri, self.PORT)
+
+        # Socks5Proxy is already a CapTPSocket; no rewrap needed
+        self._connections.add(onion_sock)
+        return CapTPSession(onion_sock, self.location, is_outbound=True)
+
+    def accept(self, timeout=120) -> CapTPSession:
+        """ Blocks until a CapTP connection is received, returning the socket """
+        self._incoming_control_socket.settimeout(timeout)
+        sock, addr = self._incoming_control_socket.accept()
+        connection = CapTPSocket.from_socket(sock)
+        self._connections.add(connection)
+        return CapTPSession(connection, self.location, is_outbound=False)
+
+    def shutdown(self):
+        """ Shuts down the netlayer, removing its hidden service
+
+        The shared Tor daemon keeps running for other netlayer
+        instances; it exits with the interpreter.
+        """
+        for connection in list(self._connections):
+            try:
+                connection.close()
+            except OSError:
+                pass
+
+        # These attributes are setup in the __init__ method, so should always exist
+        # however there are situations where an error occurs before they are set
+        if getattr(self, "_incoming_control_socket", None) is not None:
+            self._incoming_control_socket.close()
+            self._incoming_control_socket = None
+
+        if getattr(self, "location", None) is not None:
+            self._daemon.remove_hidden_service(self.location.address)
+            self.location = None
@@ -14,25 +14,30 @@
 
 import argparse
 import sys
-from urllib.parse import urlparse
 
 from contrib.syrup import Symbol
 from utils.ocapn_uris import OCapNNode
 from utils.test_suite import CapTPTestRunner
-from netlayers.onion import OnionNetlayer
-from netlayers.testing_only_tcp import TestingOnlyTCPNetlayer
+
+# Interned once at import time rather than rebuilt per comparison
+_SYM_ONION = Symbol("onion")
+_SYM_TCP_TESTING_ONLY = Symbol("tcp-testing-only")
 
 
 def setup_netlayer(ocapn_node):
     """ Setup the netlayer for the provided OCapN node """
-    if ocapn_node.transport == Symbol("onion"):
+    # The netlayers are imported lazily so that only the transport
+    # being tested pays its import cost (stem in particular is heavy)
+    if ocapn_node.transport == _SYM_ONION:
+        from netlayers.onion import OnionNetlayer
         return OnionNetlayer()
-    elif ocapn_node.transport == Symbol("tcp-testing-only"):
-        url = urlparse(f"tcp-testing-only://{ocapn_node.address}")
-        if url.port is None:
+    elif ocapn_node.transport == _SYM_TCP_TESTING_ONLY:
+        from netlayers.testing_only_tcp import TestingOnlyTCPNetlayer
+        host, _, port = ocapn_node.address.rpartition(":")
+        if not port.isdigit():
             raise Exception("All tcp-testing-only URIs require a port")
         else:
-            return TestingOnlyTCPNetlayer(url.hostname, url.port)
+            return TestingOnlyTCPNetlayer(host, int(port))
     else:
         raise ValueError(f"Unsupported transport layer: {ocapn_node.transport}")
 
@@ -75,6 +80,7 @@ if __name__ == "__main__":
 
     verbosity = 2 if args.verbose else 1
 
-    runner = CapTPTestRunner(netlayer, ocapn_node_uri, args.captp_version, verbosity=verbosity)
-    suite = runner.loadTests(args.test_module)
-    runner.run(suite)
+    with netlayer:
+        runner = CapTPTestRunner(netlayer, ocapn_node_uri, args.captp_version, verbosity=verbosity)
+        suite = runner.loadTests(args.test_module)
+        runner.run(suite)
@@ -21,18 +21,19 @@ from utils.captp_types import OpGcExport, OpGcAnswer, OpDeliverOnly
 class GCTestCase(CapTPTestCase):
 
     def _expect_gc_for_position(self, gc_type, position, timeout=30):
-        while timeout > 0:
-            start_time = time.time()
-            gc_msg = self.remote.expect_message_type(gc_type, timeout)
-
-            if isinstance(gc_msg, OpGcExport) and gc_msg.export_position == position:
-                return gc_msg
-
-            if isinstance(gc_msg, OpGcAnswer) and gc_msg.answer_position == position:
+        # A single monotonic deadline rather than re-measuring wall-clock
+        # time per iteration; monotonic time is immune to clock jumps.
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            gc_msg = self.remote.expect_message_type(gc_type, remaining)
+
+            # Both GC ops expose the position they collect as .position
+            if isinstance(gc_msg, gc_type) and gc_msg.position == position:
                 return gc_msg
 
-            timeout -= time.time() - start_time
-
 
 class OpGcExportTest(GCTestCase):
     """ `op:gc-export` - Garbage Collection for normal object exports """
@@ -77,12 +78,13 @@ class OpGcExportTest(GCTestCase):
         # The GC operation messages could be sent as one or multiple messages, so long as
         # the wire delta of all messages add up to the wire delta we're expecting it's
         # valid behavor.
-        timeout = 30
+        deadline = time.monotonic() + 30
         seen_wire_delta = 0
-        while timeout > 0 and seen_wire_delta < ref_count:
-            start_time = time.time()
-            gc_message = self._expect_gc_for_position(OpGcExport, a_local_obj.position, timeout)
-            timeout -= time.time() - start_time
+        while seen_wire_delta < ref_count:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            gc_message = self._expect_gc_for_position(OpGcExport, a_local_obj.position, remaining)
             if gc_message is None:
                 continue
 
@@ -99,22 +101,24 @@ class OpGcExportTest(GCTestCase):
         a_local_obj = self.remote.next_import_object
         ref_count = 4
 
-        for i in range(ref_count):
-            deliver_only_op = OpDeliverOnly(
-                echo_gc_refr,
-                [a_local_obj]
-            )
-            self.remote.send_message(deliver_only_op)
+        # The messages are identical, so one op is encoded once and sent
+        # ref_count times in a single batched write
+        deliver_only_op = OpDeliverOnly(
+            echo_gc_refr,
+            [a_local_obj]
+        )
+        self.remote.send_messages([deliver_only_op] * ref_count)
 
         # The GC operation messages could be sent as one or multiple messages, so long as
         # the wire delta of all messages add up to the wire delta we're expecting it's
         # valid behavor.
-        timeout = 30
+        deadline = time.monotonic() + 30
         seen_wire_delta = 0
-        while timeout > 0 and seen_wire_delta < ref_count:
-            start_time = time.time()
-            gc_message = self._expect_gc_for_position(OpGcExport, a_local_obj.position, timeout)
-            timeout -= time.time() - start_time
+        while seen_wire_delta < ref_count:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            gc_message = self._expect_gc_for_position(OpGcExport, a_local_obj.position, remaining)
             if gc_message is None:
                 continue
 
@@ -20,13 +20,16 @@ OBJECT_TO_FETCH = b"VMDDd1voKWarCe2GvgLbxbVFysNzRPzx"
 class OpAbortTest(CapTPTestCase):
     """ `op:abort` - end a session through aborting """
 
+    # The abort op is immutable and identical on every run, so build it
+    # once at class scope rather than per test
+    ABORT_OP = OpAbort("test-abort-before-setup")
+
     def test_abort_before_setup(self):
         """ Aborting a session before a session has been fully setup """
         self.remote = self.netlayer.connect(self.ocapn_uri)
 
         # Lets then abort the session and then send our `op:start-session`
-        abort_op = OpAbort("test-abort-before-setup")
-        self.remote.send_message(abort_op)
+        self.remote.send_message(self.ABORT_OP)
 
         with self.assertRaises((TimeoutError, ConnectionAbortedError)):
             # Now setup the session
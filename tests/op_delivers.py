@@ -77,9 +77,8 @@ class OpDeliverTest(CapTPTestCase):
             answer_position=self.remote.next_answer.position,
             resolve_me_desc=self.remote.next_import_object
         )
-        self.remote.send_message(build_car_factory_op)
 
-        # Now send a message to the promise of a car factory asking it to build
+        # Now a message to the promise of a car factory asking it to build
         # us a car.
         build_car_op = OpDeliver(
             to=build_car_factory_op.vow,
@@ -87,16 +86,16 @@ class OpDeliverTest(CapTPTestCase):
             answer_position=self.remote.next_answer.position,
             resolve_me_desc=self.remote.next_import_object
         )
-        self.remote.send_message(build_car_op)
 
-        # Finally send a message to the promise of a car, telling it to drive
+        # Finally a message to the promise of a car, telling it to drive.
+        # The whole pipeline goes out as one batched write.
         drive_op = OpDeliver(
             to=build_car_op.vow,
             args=[],
             answer_position=False,
             resolve_me_desc=self.remote.next_import_object
         )
-        self.remote.send_message(drive_op)
+        self.remote.send_messages([build_car_factory_op, build_car_op, drive_op])
         response = self.remote.expect_promise_resolution(drive_op.exported_resolve_me_desc)
         self.assertEqual(response.args, [Symbol("fulfill"), "Vroom! I am a red zoomracer car!"])
 
@@ -118,7 +117,6 @@ class OpDeliverTest(CapTPTestCase):
             answer_position=self.remote.next_answer.position,
             resolve_me_desc=self.remote.next_import_object
         )
-        self.remote.send_message(car_factory_build_op)
 
         # Lets introduce the error by providing invalid arguments to the car.
         invalid_make_car_op = OpDeliver(
@@ -127,16 +125,16 @@ class OpDeliverTest(CapTPTestCase):
             answer_position=self.remote.next_answer.position,
             resolve_me_desc=self.remote.next_import_object
         )
-        self.remote.send_message(invalid_make_car_op)
 
-        # Finally send a message to the promise of a car, telling it to drive
+        # Finally a message to the promise of a car, telling it to drive.
+        # The whole pipeline goes out as one batched write.
         drive_op = OpDeliver(
             to=invalid_make_car_op.vow,
             args=[],
             answer_position=False,
             resolve_me_desc=self.remote.next_import_object
         )
-        self.remote.send_message(drive_op)
+        self.remote.send_messages([car_factory_build_op, invalid_make_car_op, drive_op])
         response = self.remote.expect_promise_resolution(drive_op.exported_resolve_me_desc)
 
         self.assertIsInstance(response, (OpDeliver, OpDeliverOnly))
@@ -54,13 +54,13 @@ class OpListenTest(CapTPTestCase):
         # First lets get a promise and resolver
         vow, resolver = self.make_promise_resolver_pair()
 
-        # Now lets listen on the promise
+        # Now lets listen on the promise and then resolve it; there is no
+        # read in between, so both ops go out as one batched write
         listen_op = OpListen(
             to=vow.to_desc_export(),
             resolve_me_desc=self.remote.next_import_object,
             wants_partial=False,
         )
-        self.remote.send_message(listen_op)
 
         # Resolve the promise
         resolved_promise_with = Symbol("ok")
@@ -68,7 +68,7 @@ class OpListenTest(CapTPTestCase):
             to=resolver.to_desc_export(),
             args=[Symbol("fulfill"), resolved_promise_with]
         )
-        self.remote.send_message(resolve_msg)
+        self.remote.send_messages([listen_op, resolve_msg])
 
         # Check we get a resolution to our object.
         response = self.remote.expect_promise_resolution(listen_op.exported_resolve_me_desc)
@@ -82,13 +82,13 @@ class OpListenTest(CapTPTestCase):
         # First lets get a promise and resolver
         vow, resolver = self.make_promise_resolver_pair()
 
-        # Now lets listen on the promise
+        # Now lets listen on the promise and then break it; there is no
+        # read in between, so both ops go out as one batched write
         listen_op = OpListen(
             to=vow.to_desc_export(),
             resolve_me_desc=self.remote.next_import_object,
             wants_partial=False,
         )
-        self.remote.send_message(listen_op)
 
         # Break the promise
         err_symbol = Symbol("oh-no")
@@ -96,7 +96,7 @@ class OpListenTest(CapTPTestCase):
             to=resolver.to_desc_export(),
             args=[Symbol("break"), err_symbol]
         )
-        self.remote.send_message(break_msg)
+        self.remote.send_messages([listen_op, break_msg])
 
         # Check we get a resolution to our object.
         response = self.remote.expect_promise_resolution(listen_op.exported_resolve_me_desc)
@@ -110,13 +110,13 @@ class OpListenTest(CapTPTestCase):
         # First lets get a promise and resolver
         vow, resolver = self.make_promise_resolver_pair()
 
-        # Lets resolve the promise
+        # Lets resolve the promise and then listen on it; the peer sees
+        # both in order from one batched write
         resolved_promise_with = Symbol("ok")
         resolve_msg = OpDeliverOnly(
             to=resolver.to_desc_export(),
             args=[Symbol("fulfill"), resolved_promise_with]
         )
-        self.remote.send_message(resolve_msg)
 
         # Now lets listen on the promise
         listen_op = OpListen(
@@ -124,7 +124,7 @@ class OpListenTest(CapTPTestCase):
             resolve_me_desc=self.remote.next_import_object,
             wants_partial=False,
         )
-        self.remote.send_message(listen_op)
+        self.remote.send_messages([resolve_msg, listen_op])
 
         # Check we get a resolution to our object.
         response = self.remote.expect_promise_resolution(listen_op.exported_resolve_me_desc)
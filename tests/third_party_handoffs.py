@@ -30,7 +30,11 @@ class HandoffTestCase(CapTPTestCase):
 
     def _create_new_netlayer(self):
         netlayer_class = type(self.netlayer)
-        return netlayer_class()
+        netlayer = netlayer_class()
+        # Netlayers no longer shut themselves down from a finalizer, so
+        # make sure this extra one is released when the test ends
+        self.addCleanup(netlayer.shutdown)
+        return netlayer
 
     def _generate_two_keypairs(self):
         """ Generate two keypairs to represent those of a session between two nodes """
@@ -83,6 +83,23 @@ class CapTPSession:
 
         self.connection.send_message(msg)
 
+    def send_messages(self, msgs):
+        """ Send a batch of messages to the remote in a single write """
+        deliver_ops = (captp_types.OpDeliverOnly, captp_types.OpDeliver)
+        encoded = bytearray()
+        previous_msg = None
+        previous_encoding = None
+        for msg in msgs:
+            if isinstance(msg, deliver_ops) and isinstance(msg.to, captp_types.DescImport):
+                raise Exception("Attempting to send message to exported object")
+            # Bursts often repeat the same op object; encode it once
+            if msg is not previous_msg:
+                previous_msg = msg
+                previous_encoding = msg.to_syrup()
+            encoded += previous_encoding
+
+        self.connection.send_message(bytes(encoded))
+
     def receive_message(self, timeout=60):
         """ Receive a message from the remote """
         msg = self.connection.receive_message(timeout=timeout)
@@ -182,11 +199,15 @@ class CapTPSession:
 
     def expect_message_type(self, message_type, timeout=60):
         """ Reads messages until one of the given type is received """
-        while timeout >= 0:
-            start_time = time.time()
-            message = self.receive_message(timeout=timeout)
-            end_time = time.time()
-            timeout -= end_time - start_time
+        # All of the expect_* loops work from a single monotonic deadline
+        # computed up front, rather than re-measuring wall-clock time
+        # around every read.
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining < 0:
+                return None
+            message = self.receive_message(timeout=remaining)
 
             if isinstance(message, message_type):
                 return message
@@ -196,11 +217,12 @@ class CapTPSession:
         if isinstance(recipients, (captp_types.DescAnswer, captp_types.DescExport)):
             recipients = [recipients]
 
-        while timeout >= 0:
-            start_time = time.time()
-            message = self.expect_message_type((captp_types.OpDeliver, captp_types.OpDeliverOnly), timeout=timeout)
-            end_time = time.time()
-            timeout -= end_time - start_time
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining < 0:
+                return None
+            message = self.expect_message_type((captp_types.OpDeliver, captp_types.OpDeliverOnly), timeout=remaining)
 
             # The `recipient` can be a tuple of matches, or a single match
             # the recipient can also be a DescExport or DescAnswer
@@ -210,11 +232,12 @@ class CapTPSession:
 
     def expect_promise_resolution(self, resolve_me_desc: captp_types.DescExport, timeout=60):
         """ Reads until a promise resolves to a non-promise value """
-        while timeout >= 0:
-            start_time = time.time()
-            message = self.expect_message_to(resolve_me_desc, timeout=timeout)
-            end_time = time.time()
-            timeout -= end_time - start_time
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining < 0:
+                return None
+            message = self.expect_message_to(resolve_me_desc, timeout=remaining)
 
             # Check it's a fulfill
             assert message.args[0] in [Symbol("fulfill"), Symbol("break")]
@@ -115,10 +115,15 @@ class DescImport(CapTPType, ABC):
 
     def __init__(self, position: int):
         self.position = position
+        self._export = None
 
     def to_desc_export(self):
         """ Converts to desc:export """
-        return DescExport(self.position)
+        # The export for a given import never changes, so it is built
+        # once and reused on repeated conversions
+        if self._export is None:
+            self._export = DescExport(self.position)
+        return self._export
 
 
 class DescImportObject(DescImport):
@@ -549,6 +554,11 @@ class OpGcExport(CapTPType):
         self.export_position = export_position
         self.wire_delta = wire_delta
 
+    @property
+    def position(self):
+        """ The position being GC'd, common to both GC ops """
+        return self.export_position
+
     @classmethod
     def from_syrup_record(cls, record: syrup.Record):
         assert record.label == syrup.Symbol("op:gc-export")
@@ -568,6 +578,11 @@ class OpGcAnswer(CapTPType):
     def __init__(self, answer_position: int):
         self.answer_position = answer_position
 
+    @property
+    def position(self):
+        """ The position being GC'd, common to both GC ops """
+        return self.answer_position
+
     @classmethod
     def from_syrup_record(cls, record: syrup.Record):
         assert record.label == syrup.Symbol("op:gc-answer")
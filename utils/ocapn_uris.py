@@ -31,6 +31,7 @@ class OCapNNode(OCapNURI):
         self.transport = transport
         self.address = address
         self.hints = hints
+        self._syrup_record = None
 
     def __eq__(self, other):
         return isinstance(other, OCapNNode) and self.to_syrup() == other.to_syrup()
@@ -53,10 +54,14 @@ class OCapNNode(OCapNURI):
         return cls(*record.args)
 
     def to_syrup_record(self) -> Record:
-        return Record(
-            Symbol("ocapn-node"),
-            [self.transport, self.address, self.hints]
-        )
+        # Nodes don't change once constructed, so the record for a node
+        # is built once and reused by every caller.
+        if self._syrup_record is None:
+            self._syrup_record = Record(
+                Symbol("ocapn-node"),
+                [self.transport, self.address, self.hints]
+            )
+        return self._syrup_record
 
     def to_uri(self) -> str:
         return f"ocapn://{self.address}.{self.transport}"
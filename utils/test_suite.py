@@ -12,20 +12,34 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import random
+import time
 import unittest
 
 
-def retry_on_network_timeout(func, retries=3):
-    """ Decorator which retries upon a network timeout """
+def retry_on_network_timeout(func, retries=3, base_delay=0.5, max_delay=5,
+                             total_timeout=120):
+    """ Decorator which retries upon a network timeout
+
+    Retries back off exponentially (capped at max_delay, with jitter so
+    parallel suite runs don't retry in lockstep) and the whole attempt
+    run is bounded by a monotonic deadline, so one flaky test can't
+    balloon the run by its retry count times the full per-attempt
+    timeout.
+    """
     def wrapper(*args, **kwargs):
+        deadline = time.monotonic() + total_timeout
         for i in range(retries):
             try:
                 return func(*args, **kwargs)
             except (TimeoutError, OSError):
                 # OSError can be raised when creating a tor daemon
                 # (should this be refactored into the tor netlayer?)
-                if i == retries - 1:
+                remaining = deadline - time.monotonic()
+                if i == retries - 1 or remaining <= 0:
                     raise
+                delay = min(base_delay * 2 ** i, max_delay) * random.uniform(0.5, 1.5)
+                time.sleep(min(delay, remaining))
     return wrapper
 
 